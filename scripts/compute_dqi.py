@@ -26,6 +26,14 @@ except ImportError:
     print("  To enable anomaly detection, ensure detect_anomalies.py is in scripts/ folder")
     ANOMALY_DETECTION_AVAILABLE = False
 
+# Optional: pyarrow CSV reader/writer (pandas CSV I/O is used without it)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 
 # ============================================================================
 # CLINICAL THRESHOLDS (from earlier fixes)
@@ -39,6 +47,16 @@ CLINICAL_THRESHOLDS = {
     'pending_sae_pct': 5.0,
 }
 
+# Frozen arrays for the vectorized DQI kernel (built once at import).
+# Weights by clinical impact: pages, visits, EDRR, coding, SAE.
+_SIGNAL_COLS = ['missing_pages_pct', 'missing_visits_pct', 'unresolved_edrr_pct',
+                'uncoded_terms_pct', 'pending_sae_pct']
+_PEN_COLS = ['penalty_pages', 'penalty_visits', 'penalty_edrr', 'penalty_codes', 'penalty_sae']
+_THRESH = np.array([CLINICAL_THRESHOLDS[col] for col in _SIGNAL_COLS], dtype=np.float64)
+_WEIGHTS = np.array([10, 15, 15, 12, 25], dtype=np.float64)
+_WTOTAL = _WEIGHTS.sum()
+_WNORM = _WEIGHTS / _WTOTAL
+
 
 def normalize_signal_vs_threshold(signal_pct, threshold_pct):
     """
@@ -59,120 +77,48 @@ def normalize_signal_vs_threshold(signal_pct, threshold_pct):
         return min(normalized, 100.0)
 
 
-def compute_dqi_study_level(study_signals):
+def _compute_dqi(signals_df, breakdown=True):
     """
-    Compute study-level DQI using threshold-based normalization.
+    Compute study- or site-level DQI using threshold-based normalization.
     
     Args:
-        study_signals (pd.DataFrame): Study-level signal percentages
+        signals_df (pd.DataFrame): Study- or site-level signal percentages
+        breakdown (bool): Also store the penalty_* breakdown columns.
+            Callers that only need dqi_score can pass False.
     
     Returns:
-        pd.DataFrame: DQI scores with penalty breakdown
+        pd.DataFrame: DQI scores (with penalty breakdown if requested)
     """
     
-    dqi_df = study_signals.copy()
+    dqi_df = signals_df.copy()
     
-    W_pages, W_visits, W_edrr, W_codes, W_sae = 10, 15, 15, 12, 25
-    total_weight = W_pages + W_visits + W_edrr + W_codes + W_sae
+    # Normalize all signals relative to clinical thresholds in one pass
+    # (same result as normalize_signal_vs_threshold, applied elementwise)
+    signals = signals_df[_SIGNAL_COLS].to_numpy(dtype=np.float64)
     
-    # Normalize each signal relative to clinical threshold
-    pct_pages = study_signals['missing_pages_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['missing_pages_pct'])
-    )
-    pct_visits = study_signals['missing_visits_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['missing_visits_pct'])
-    )
-    pct_edrr = study_signals['unresolved_edrr_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['unresolved_edrr_pct'])
-    )
-    pct_codes = study_signals['uncoded_terms_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['uncoded_terms_pct'])
-    )
-    pct_sae = study_signals['pending_sae_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['pending_sae_pct'])
-    )
+    pen = np.clip((signals - _THRESH) / _THRESH * 100, 0, 100)
     
-    # Compute weighted penalty
-    weighted_penalty = (
-        (pct_pages * W_pages) +
-        (pct_visits * W_visits) +
-        (pct_edrr * W_edrr) +
-        (pct_codes * W_codes) +
-        (pct_sae * W_sae)
-    ) / total_weight
+    # DQI = 100 - weighted penalty
+    # (sum on the raw weights, then normalize: same rounding as the original)
+    dqi = 100 - np.einsum('ij,j->i', pen, _WEIGHTS) / _WTOTAL
     
-    # DQI = 100 - penalty
-    dqi_df['dqi_score'] = 100 - weighted_penalty
-    
-    # Store penalty breakdown for transparency
-    dqi_df['penalty_pages'] = pct_pages * (W_pages / total_weight)
-    dqi_df['penalty_visits'] = pct_visits * (W_visits / total_weight)
-    dqi_df['penalty_edrr'] = pct_edrr * (W_edrr / total_weight)
-    dqi_df['penalty_codes'] = pct_codes * (W_codes / total_weight)
-    dqi_df['penalty_sae'] = pct_sae * (W_sae / total_weight)
+    # Penalty breakdown for transparency (scaled in place, no extra buffer)
+    contrib = pen
+    if breakdown:
+        contrib *= _WNORM
     
     # Round for readability
-    dqi_df['dqi_score'] = dqi_df['dqi_score'].round(2)
-    for col in ['penalty_pages', 'penalty_visits', 'penalty_edrr', 'penalty_codes', 'penalty_sae']:
-        dqi_df[col] = dqi_df[col].round(2)
+    dqi_df['dqi_score'] = np.round(dqi, 2)
+    if breakdown:
+        np.round(contrib, 2, out=contrib)
+        for j, col in enumerate(_PEN_COLS):
+            dqi_df[col] = contrib[:, j]
     
     return dqi_df
 
 
-def compute_dqi_site_level(site_signals):
-    """
-    Compute site-level DQI using threshold-based normalization.
-    
-    Args:
-        site_signals (pd.DataFrame): Site-level signal percentages
-    
-    Returns:
-        pd.DataFrame: Site DQI scores with penalty breakdown
-    """
-    
-    dqi_df = site_signals.copy()
-    
-    W_pages, W_visits, W_edrr, W_codes, W_sae = 10, 15, 15, 12, 25
-    total_weight = W_pages + W_visits + W_edrr + W_codes + W_sae
-    
-    # Normalize relative to clinical thresholds
-    pct_pages = site_signals['missing_pages_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['missing_pages_pct'])
-    )
-    pct_visits = site_signals['missing_visits_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['missing_visits_pct'])
-    )
-    pct_edrr = site_signals['unresolved_edrr_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['unresolved_edrr_pct'])
-    )
-    pct_codes = site_signals['uncoded_terms_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['uncoded_terms_pct'])
-    )
-    pct_sae = site_signals['pending_sae_pct'].apply(
-        lambda x: normalize_signal_vs_threshold(x, CLINICAL_THRESHOLDS['pending_sae_pct'])
-    )
-    
-    weighted_penalty = (
-        (pct_pages * W_pages) +
-        (pct_visits * W_visits) +
-        (pct_edrr * W_edrr) +
-        (pct_codes * W_codes) +
-        (pct_sae * W_sae)
-    ) / total_weight
-    
-    dqi_df['dqi_score'] = 100 - weighted_penalty
-    
-    dqi_df['penalty_pages'] = pct_pages * (W_pages / total_weight)
-    dqi_df['penalty_visits'] = pct_visits * (W_visits / total_weight)
-    dqi_df['penalty_edrr'] = pct_edrr * (W_edrr / total_weight)
-    dqi_df['penalty_codes'] = pct_codes * (W_codes / total_weight)
-    dqi_df['penalty_sae'] = pct_sae * (W_sae / total_weight)
-    
-    dqi_df['dqi_score'] = dqi_df['dqi_score'].round(2)
-    for col in ['penalty_pages', 'penalty_visits', 'penalty_edrr', 'penalty_codes', 'penalty_sae']:
-        dqi_df[col] = dqi_df[col].round(2)
-    
-    return dqi_df
+# Study- and site-level DQI share one kernel; callers keep the old names.
+compute_dqi_study_level = compute_dqi_site_level = _compute_dqi
 
 
 def print_dqi_summary(study_dqi):
@@ -205,16 +151,34 @@ def print_dqi_summary(study_dqi):
     print(f"\nAverage DQI: {avg_dqi:.2f}")
 
 
+def _write_csv(df, path):
+    """
+    Write df to CSV (no index) with pyarrow's C writer, else pandas.
+    
+    pyarrow's output reads back to the same values but is not byte-identical
+    to to_csv: headers and string fields are always quoted (its "needed"
+    quoting style, the default, still quotes every string) and whole-number
+    floats lose the ".0" (90.0 is written as 90).
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+            return
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+    df.to_csv(path, index=False)
+
+
 def save_dqi_scores(study_dqi, site_dqi, output_path="outputs/dqi_scores.csv"):
     """Save DQI scores to CSV files."""
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    study_dqi.to_csv(output_path, index=False)
+    _write_csv(study_dqi, output_path)
     print(f"✓ Study-level DQI saved to: {output_path}")
     
     site_path = output_path.replace('dqi_scores.csv', 'dqi_scores_site_level.csv')
-    site_dqi.to_csv(site_path, index=False)
+    _write_csv(site_dqi, site_path)
     print(f"✓ Site-level DQI saved to: {site_path}")
     
     return study_dqi, site_dqi
@@ -232,8 +196,19 @@ if __name__ == "__main__":
     if not os.path.exists(study_signals_path) or not os.path.exists(site_signals_path):
         print(f"\n❌ Signal files not found. Run extract_signals.py first.")
     else:
-        study_signals = pd.read_csv(study_signals_path)
-        site_signals = pd.read_csv(site_signals_path)
+        # Only the columns carried into the DQI tables, with signals parsed as float64
+        csv_engine = 'pyarrow' if PYARROW_AVAILABLE else 'c'
+        signal_dtypes = {col: 'float64' for col in _SIGNAL_COLS}
+        study_signals = pd.read_csv(
+            study_signals_path,
+            usecols=['study_id', *_SIGNAL_COLS, 'file_count', 'row_count'],
+            dtype=signal_dtypes, engine=csv_engine
+        )
+        site_signals = pd.read_csv(
+            site_signals_path,
+            usecols=['study_id', 'site_id', *_SIGNAL_COLS, 'file_count', 'row_count'],
+            dtype=signal_dtypes, engine=csv_engine
+        )
         
         print(f"\nLoaded signals for {len(study_signals)} studies and {len(site_signals)} sites")
         
@@ -261,15 +236,15 @@ if __name__ == "__main__":
             print(f"✓ Anomaly scores saved to: outputs/anomalies_site_level.csv")
             
             # Also merge anomaly info into study level
-            anomalies_summary = anomalies_site.groupby('study_id').agg({
-                'anomaly_score': 'mean',
-                'is_anomalous': 'sum'
-            }).reset_index()
-            anomalies_summary.columns = ['study_id', 'avg_anomaly_score', 'num_anomalous_sites']
+            anomalies_summary = anomalies_site.groupby('study_id', sort=False, observed=True).agg(
+                avg_anomaly_score=('anomaly_score', 'mean'),
+                num_anomalous_sites=('is_anomalous', 'sum')
+            ).reset_index()
             
             study_dqi = study_dqi.merge(anomalies_summary, on='study_id', how='left')
-            study_dqi['avg_anomaly_score'] = study_dqi['avg_anomaly_score'].fillna(0)
-            study_dqi['num_anomalous_sites'] = study_dqi['num_anomalous_sites'].fillna(0)
+            anomaly_cols = ['avg_anomaly_score', 'num_anomalous_sites']
+            study_dqi[anomaly_cols] = study_dqi[anomaly_cols].fillna(0)
+            study_dqi = study_dqi.astype({'num_anomalous_sites': 'int32'})
         else:
             print("\n⚠ Skipping anomaly detection (module not available)")
             # Add placeholder columns for consistency
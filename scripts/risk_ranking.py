@@ -8,7 +8,8 @@ Changes from original:
   3. Identify risk driver: "Rule-based" vs "Anomalous pattern"
   4. Output anomaly metadata for explanations
 
-All percentile-based logic remains unchanged.
+Percentile cutoffs are taken on DQI, where lower is worse: scores at or
+below the 10th percentile are High Risk, up to the 25th Medium Risk.
 ML amplification is used in DQI calculation, not in risk logic.
 """
 
@@ -16,6 +17,38 @@ import os
 import pandas as pd
 import numpy as np
 
+# Optional: pyarrow CSV writer (pandas to_csv is used without it)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Signal percentage columns summed into total_signal_pct
+SIGNAL_COLS = ['missing_pages_pct', 'missing_visits_pct', 'unresolved_edrr_pct',
+               'uncoded_terms_pct', 'pending_sae_pct']
+
+# Risk categories (ordered categorical codes: 0 = worst)
+RISK_LEVELS = ['High Risk', 'Medium Risk', 'Low Risk']
+RISK_DRIVERS = ['Rule-based', 'ML-Detected Anomaly']
+
+# Driver column → display label, for penalty_* (new) and raw signal (old) DQI tables
+_NEW_COLS = {
+    'penalty_pages': 'CRF Pages',
+    'penalty_visits': 'Missing Visits',
+    'penalty_edrr': 'EDRR Queries',
+    'penalty_codes': 'Uncoded Terms',
+    'penalty_sae': 'SAE Reviews',
+}
+_OLD_COLS = {
+    'missing_pages_pct': 'CRF Pages',
+    'missing_visits_pct': 'Missing Visits',
+    'unresolved_edrr_pct': 'EDRR Queries',
+    'uncoded_terms_pct': 'Uncoded Terms',
+    'pending_sae_pct': 'SAE Reviews',
+}
+
 
 def categorize_risk_with_guardrails(dqi_scores_series):
     """
@@ -30,62 +63,133 @@ def categorize_risk_with_guardrails(dqi_scores_series):
         dqi_scores_series (pd.Series): DQI scores
     
     Returns:
-        pd.Series: Risk categories
+        pd.Series: Risk categories (ordered categorical)
     """
     
-    p90 = dqi_scores_series.quantile(0.90)
-    p75 = dqi_scores_series.quantile(0.75)
+    arr = dqi_scores_series.to_numpy(dtype=np.float64)
     
-    def assign_risk(score):
-        if score <= p90:
-            return "High Risk"
-        elif score <= p75:
-            return "Medium Risk"
-        else:
-            return "Low Risk"
+    # Lower DQI = worse quality, so the worst 10% sit at or below the
+    # 10th percentile and the next 15% at or below the 25th (both cutoffs
+    # from one pass; NaN scores are ignored, as Series.quantile does)
+    p10, p25 = np.nanquantile(arr, [0.10, 0.25]) if arr.size else (np.nan, np.nan)
     
-    return dqi_scores_series.apply(assign_risk)
+    # 0 = High, 1 = Medium, 2 = Low (NaN scores compare False → Low Risk)
+    idx = 2 - (arr <= p25).astype(np.int8) - (arr <= p10).astype(np.int8)
+    
+    return pd.Series(
+        pd.Categorical.from_codes(idx, categories=RISK_LEVELS, ordered=True),
+        index=dqi_scores_series.index
+    )
 
 
-def identify_top_penalty_drivers(row, top_n=2):
+def driver_columns(columns):
     """
-    Identify top penalty drivers for a site/study.
+    Pick the penalty (or legacy signal) columns used to name risk drivers.
     
     Args:
-        row (pd.Series): DQI record with penalty columns
-        top_n (int): Number of top drivers to return
+        columns (pd.Index): Columns of a DQI table
     
     Returns:
-        list: Names of top penalty drivers
+        tuple: (cols, labels) — present driver columns and their display
+            labels, in priority order (absent columns count as 0 and are
+            never reported, so they are dropped)
     """
     
-    signal_cols = {
-        'penalty_pages': 'CRF Pages',
-        'penalty_visits': 'Missing Visits',
-        'penalty_edrr': 'EDRR Queries',
-        'penalty_codes': 'Uncoded Terms',
-        'penalty_sae': 'SAE Reviews',
-    }
-    
     # If old column names, use alternative mapping
-    if 'penalty_pages' not in row.index:
-        signal_cols = {
-            'missing_pages_pct': 'CRF Pages',
-            'missing_visits_pct': 'Missing Visits',
-            'unresolved_edrr_pct': 'EDRR Queries',
-            'uncoded_terms_pct': 'Uncoded Terms',
-            'pending_sae_pct': 'SAE Reviews',
-        }
-    
-    penalties = {}
-    for col, label in signal_cols.items():
-        if col in row.index:
-            penalties[label] = float(row.get(col, 0))
-        else:
-            penalties[label] = 0
-    
-    sorted_penalties = sorted(penalties.items(), key=lambda x: x[1], reverse=True)
-    return [p[0] for p in sorted_penalties[:top_n] if p[1] > 0]
+    mapping = _NEW_COLS if 'penalty_pages' in columns else _OLD_COLS
+    cols = [col for col in mapping if col in columns]
+    labels = np.array([mapping[col] for col in cols], dtype=object)
+    
+    return cols, labels
+
+
+def top_penalty_drivers(penalties, labels, top_n=2):
+    """
+    Name the top penalty drivers of every row of a penalty block.
+    
+    Args:
+        penalties (np.ndarray): (rows, drivers) penalty values, NaN-free
+        labels (np.ndarray): Driver label per column of penalties
+        top_n (int): Number of top drivers to return per row
+    
+    Returns:
+        np.ndarray: Comma-separated top driver names per row (largest first)
+    """
+    
+    # Stable descending order keeps column order on ties
+    k = min(top_n, len(labels))
+    if k == 0:
+        return np.full(len(penalties), '', dtype=object)
+    top_idx = np.argsort(-penalties, axis=1, kind='stable')[:, :k]
+    top_vals = np.take_along_axis(penalties, top_idx, axis=1)
+    top_labels = np.where(top_vals > 0, labels[top_idx], '')
+    
+    # Non-positive drivers sort last, so blanks only ever trail: join the
+    # label columns in pandas' string kernels and trim the empty tail
+    joined = pd.Series(top_labels[:, 0])
+    if k > 1:
+        others = [pd.Series(top_labels[:, j]) for j in range(1, k)]
+        joined = joined.str.cat(others, sep=', ').str.rstrip(', ')
+    
+    return joined.to_numpy(dtype=object)
+
+
+def rank_by_dqi(dqi_scores_series):
+    """
+    Rank DQI scores from worst (lowest) to best.
+    
+    Args:
+        dqi_scores_series (pd.Series): DQI scores
+    
+    Returns:
+        tuple: (order, rank) — positions sorted worst-first, and the
+            1-based rank of each row in its original position
+    """
+    
+    order = np.argsort(dqi_scores_series.to_numpy(), kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(1, len(order) + 1)
+    
+    return order, rank
+
+
+def _rank_common(dqi_df, dqi_column):
+    """
+    Shared ranking pipeline for studies and sites.
+    
+    Args:
+        dqi_df (pd.DataFrame): Study- or site-level DQI scores
+        dqi_column (str): DQI column used for categorization and ranking
+    
+    Returns:
+        tuple: (order, columns) — worst-first row positions, and a dict of
+            risk_level, top_risk_drivers, total_signal_pct and rank arrays
+            aligned with dqi_df's rows
+    """
+    
+    # Percentile-based risk categorization
+    risk_level = categorize_risk_with_guardrails(dqi_df[dqi_column]).array
+    
+    # Identify top risk drivers from one float32 (rows, drivers) block:
+    # percentages in [0, 100] need no more precision to be ordered, and
+    # NaN is filled during the conversion instead of in a second copy
+    cols, labels = driver_columns(dqi_df.columns)
+    penalties = dqi_df[cols].to_numpy(dtype=np.float32, na_value=0.0)
+    top_risk_drivers = top_penalty_drivers(penalties, labels, top_n=2)
+    
+    # Count total signal percentage (kept at input precision, it is written out)
+    present = [col for col in SIGNAL_COLS if col in dqi_df.columns]
+    total_signal_pct = dqi_df[present].to_numpy().sum(axis=1) if present else 0.0
+    
+    # Rank by DQI (worst first) without permuting the whole frame
+    order, rank = rank_by_dqi(dqi_df[dqi_column])
+    
+    return order, {
+        'risk_level': risk_level,
+        'top_risk_drivers': top_risk_drivers,
+        'total_signal_pct': total_signal_pct,
+        'rank': rank,
+    }
 
 
 def rank_studies(study_dqi):
@@ -99,36 +203,17 @@ def rank_studies(study_dqi):
         pd.DataFrame: Ranked studies with risk categories
     """
     
-    ranked = study_dqi.copy()
-    
     # Use amplified DQI if available, otherwise use original
-    dqi_column = 'dqi_score_amplified' if 'dqi_score_amplified' in ranked.columns else 'dqi_score'
+    dqi_column = 'dqi_score_amplified' if 'dqi_score_amplified' in study_dqi.columns else 'dqi_score'
     
     print(f"\nRisk categorization using: {dqi_column}")
     
-    # Percentile-based risk categorization
-    ranked['risk_level'] = categorize_risk_with_guardrails(ranked[dqi_column])
-    
-    # Identify top risk drivers
-    ranked['top_risk_drivers'] = ranked.apply(
-        lambda row: ", ".join(identify_top_penalty_drivers(row, top_n=2)),
-        axis=1
-    )
-    
-    # Rank by DQI (worst first)
-    ranked = ranked.sort_values(dqi_column).reset_index(drop=True)
-    ranked['rank'] = range(1, len(ranked) + 1)
-    
-    # Count total signals
-    ranked['total_signal_pct'] = (
-        ranked.get('missing_pages_pct', 0) + 
-        ranked.get('missing_visits_pct', 0) + 
-        ranked.get('unresolved_edrr_pct', 0) + 
-        ranked.get('uncoded_terms_pct', 0) + 
-        ranked.get('pending_sae_pct', 0)
-    )
+    order, columns = _rank_common(study_dqi, dqi_column)
+    ranked = study_dqi.assign(**columns)
     
-    return ranked[['rank', 'study_id', 'dqi_score', 'risk_level', 'total_signal_pct', 'top_risk_drivers']]
+    # Only the output columns are reordered worst-first
+    ranked = ranked[['rank', 'study_id', 'dqi_score', 'risk_level', 'total_signal_pct', 'top_risk_drivers']]
+    return ranked.iloc[order].reset_index(drop=True)
 
 
 def rank_sites(site_dqi):
@@ -143,46 +228,33 @@ def rank_sites(site_dqi):
         pd.DataFrame: Ranked sites with risk categories
     """
     
-    ranked = site_dqi.copy()
-    
     # Use amplified DQI if available, otherwise use original
-    dqi_column = 'dqi_score_amplified' if 'dqi_score_amplified' in ranked.columns else 'dqi_score'
+    dqi_column = 'dqi_score_amplified' if 'dqi_score_amplified' in site_dqi.columns else 'dqi_score'
     
     print(f"Risk categorization using: {dqi_column}")
     
-    # Percentile-based risk categorization
-    ranked['risk_level'] = categorize_risk_with_guardrails(ranked[dqi_column])
-    
-    # Identify top drivers
-    ranked['top_risk_drivers'] = ranked.apply(
-        lambda row: ", ".join(identify_top_penalty_drivers(row, top_n=2)),
-        axis=1
-    )
+    order, columns = _rank_common(site_dqi, dqi_column)
+    columns['global_rank'] = columns.pop('rank')
     
     # Identify risk driver (rule-based vs anomaly)
-    ranked['risk_driver'] = 'Rule-based'
-    if 'is_anomalous' in ranked.columns:
-        anomalous_high = (ranked['is_anomalous'] == 1) & (ranked['risk_level'] == 'High Risk')
-        ranked.loc[anomalous_high, 'risk_driver'] = 'ML-Detected Anomaly'
-    
-    # Rank globally
-    ranked = ranked.sort_values(dqi_column).reset_index(drop=True)
-    ranked['global_rank'] = range(1, len(ranked) + 1)
-    
-    # Rank within-study
-    ranked['within_study_rank'] = ranked.groupby('study_id').cumcount() + 1
-    
-    # Count total signal percentage
-    ranked['total_signal_pct'] = (
-        ranked.get('missing_pages_pct', 0) + 
-        ranked.get('missing_visits_pct', 0) + 
-        ranked.get('unresolved_edrr_pct', 0) + 
-        ranked.get('uncoded_terms_pct', 0) + 
-        ranked.get('pending_sae_pct', 0)
+    # (code 0 = High Risk / Rule-based, code 1 = ML-Detected Anomaly)
+    anomalous_high = np.zeros(len(site_dqi), dtype=bool)
+    if 'is_anomalous' in site_dqi.columns:
+        anomalous_high = (site_dqi['is_anomalous'].to_numpy() == 1) & (columns['risk_level'].codes == 0)
+    columns['risk_driver'] = pd.Categorical.from_codes(anomalous_high.astype(np.int8), categories=RISK_DRIVERS)
+    
+    # Rank within-study (global order among the study's own sites); sites
+    # with a missing study_id are ranked together rather than dropped
+    columns['within_study_rank'] = (
+        pd.Series(columns['global_rank'], index=site_dqi.index)
+        .groupby(site_dqi['study_id'], dropna=False).rank(method='first').astype('int32')
     )
     
-    return ranked[['study_id', 'site_id', 'global_rank', 'within_study_rank', 'dqi_score', 
-                   'risk_level', 'risk_driver', 'total_signal_pct', 'top_risk_drivers']]
+    ranked = site_dqi.assign(**columns)
+    
+    ranked = ranked[['study_id', 'site_id', 'global_rank', 'within_study_rank', 'dqi_score', 
+                     'risk_level', 'risk_driver', 'total_signal_pct', 'top_risk_drivers']]
+    return ranked.iloc[order].reset_index(drop=True)
 
 
 def generate_risk_summary(study_ranks):
@@ -196,9 +268,10 @@ def generate_risk_summary(study_ranks):
         str: Summary text
     """
     
-    high_risk = len(study_ranks[study_ranks['risk_level'] == 'High Risk'])
-    medium_risk = len(study_ranks[study_ranks['risk_level'] == 'Medium Risk'])
-    low_risk = len(study_ranks[study_ranks['risk_level'] == 'Low Risk'])
+    counts = study_ranks['risk_level'].value_counts()
+    high_risk = int(counts.get('High Risk', 0))
+    medium_risk = int(counts.get('Medium Risk', 0))
+    low_risk = int(counts.get('Low Risk', 0))
     total = len(study_ranks)
     
     summary = f"""
@@ -222,18 +295,36 @@ Top 3 Most At-Risk Studies:
     return summary
 
 
+def _write_csv(df, path):
+    """
+    Write df to CSV (no index) with pyarrow's C writer, else pandas.
+    
+    pyarrow's output reads back to the same values but is not byte-identical
+    to to_csv: headers and string fields are always quoted (its "needed"
+    quoting style, the default, still quotes every string) and whole-number
+    floats lose the ".0" (90.0 is written as 90).
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+            return
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            pass
+    df.to_csv(path, index=False)
+
+
 def save_risk_rankings(study_ranks, site_ranks, output_path="outputs/risk_rankings.csv"):
     """Save risk rankings to CSV files."""
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     # Study-level rankings
-    study_ranks.to_csv(output_path, index=False)
+    _write_csv(study_ranks, output_path)
     print(f"\n✓ Study-level risk rankings saved to: {output_path}")
     
     # Site-level rankings
     site_path = output_path.replace('risk_rankings.csv', 'risk_rankings_site_level.csv')
-    site_ranks.to_csv(site_path, index=False)
+    _write_csv(site_ranks, site_path)
     print(f"✓ Site-level risk rankings saved to: {site_path}")
     
     return study_ranks, site_ranks
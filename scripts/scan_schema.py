@@ -1,23 +1,415 @@
 """
-STEP 1: SCHEMA DISCOVERY & EXTRACTION (UNCHANGED)
-=================================================
+STEP 1: SCHEMA DISCOVERY & EXTRACTION
+=====================================
 
-Status: NO CHANGES FROM ORIGINAL
+Changes from original:
+  1. Headers are read without pandas: CSV via csv.reader, .xlsx/.xlsm
+     straight from the ZIP archive (openpyxl/pandas as fallbacks)
+  2. Header reads run on a thread pool; results keep discovery order
+  3. Unchanged files reuse headers from outputs/schema_cache.json
+
+Column names still follow pandas' read_csv/read_excel rules.
 This module is unaffected by ML integration.
-It simply discovers available files and extracts column names.
 """
 
 import os
+import re
+import csv
+import itertools
+import math
+import zipfile
+import xml.etree.ElementTree as ET
 import pandas as pd
+from pandas.errors import EmptyDataError
 from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import json
 
-def scan_schema(data_dir="data"):
+# Optional: openpyxl read-only header reads (pandas ExcelFile is used without it)
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# Optional: orjson for the schema map dump (stdlib json is used without it)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# File types picked up by the schema scan (matched case-insensitively)
+_SCHEMA_SUFFIXES = ('.csv', '.xls', '.xlsx', '.xlsm')
+
+# Error cells (#N/A, #DIV/0!, ...) read as NaN, like read_excel. One shared
+# object, so repeated error headers are de-duplicated as pandas does.
+_ERROR_CELL = float('nan')
+
+# Bump when the cached header format (or how headers are read) changes
+_SCHEMA_CACHE_VERSION = 2
+
+# First path component that names a study folder (split on this platform's
+# separators only; a backslash is a legal filename character on POSIX)
+_PATH_SEPS = os.sep + (os.altsep or '')
+_STUDY_RE = re.compile(rf'(?:^|[{re.escape(_PATH_SEPS)}])Study_[^{re.escape(_PATH_SEPS)}]*')
+
+
+def _normalize_header(values):
+    """
+    Turn a raw header row into the column names pandas would produce.
+    
+    Blank cells become "Unnamed: <i>" and repeated names get ".1", ".2", ...
+    suffixes, matching read_csv/read_excel with header=0.
+    
+    Args:
+        values (list): Raw header cell values
+    
+    Returns:
+        list: Column names
+    """
+    
+    names = []
+    unnamed = []
+    for i, v in enumerate(values):
+        if v is None or v == '':
+            unnamed.append(i)
+            names.append(f"Unnamed: {i}")
+        else:
+            names.append(v)
+    
+    # Same mangling order as the pandas parsers: given names keep priority
+    counts = defaultdict(int)
+    named = [i for i in range(len(names)) if i not in unnamed]
+    for i in named + unnamed:
+        col = old_col = names[i]
+        cur_count = counts[col]
+        while cur_count > 0:
+            counts[old_col] = cur_count + 1
+            col = f"{old_col}.{cur_count}"
+            cur_count = cur_count + 1 if col in names else counts[col]
+        names[i] = col
+        counts[col] = cur_count + 1
+    
+    return names
+
+
+def _local(tag):
+    """Strip the XML namespace from an element tag or attribute name."""
+    return tag.rpartition('}')[2]
+
+
+def _xml_text(el):
+    """Concatenate the plain and rich-text runs of a string item (no phonetic runs)."""
+    
+    parts = []
+    for child in el:
+        name = _local(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            parts.extend(t.text or '' for t in child if _local(t.tag) == 't')
+    return ''.join(parts)
+
+
+def _zip_part(base, target):
+    """Resolve a relationship target against the folder of its source part."""
+    
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+
+
+def _col_index(ref):
+    """Zero-based column index of a cell reference such as "AB1"."""
+    
+    idx = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        idx = idx * 26 + (ord(ch.upper()) - 64)
+    return idx - 1
+
+
+def _read_xlsx_header_zip(full_path):
+    """
+    Read row 1 of the first sheet of an .xlsx/.xlsm file straight from the
+    ZIP archive, streaming only the workbook part, the first sheet up to the
+    header row, and as many shared strings as it references.
+    
+    Args:
+        full_path (Path): Workbook path
+    
+    Returns:
+        list: Column names, or None if the header cannot be decoded exactly
+            (e.g. possible date cells) and a full reader should be used
+    """
+    
+    with zipfile.ZipFile(full_path) as z:
+        with z.open('xl/workbook.xml') as f:
+            sheet = next((el for _, el in ET.iterparse(f) if _local(el.tag) == 'sheet'), None)
+        if sheet is None:
+            return []
+        sheet_rid = next(v for k, v in sheet.attrib.items() if _local(k) == 'id')
+        
+        sheet_part = shared_part = None
+        with z.open('xl/_rels/workbook.xml.rels') as f:
+            for _, el in ET.iterparse(f):
+                if _local(el.tag) != 'Relationship':
+                    continue
+                if el.get('Id') == sheet_rid:
+                    sheet_part = _zip_part('xl', el.get('Target'))
+                elif el.get('Type', '').endswith('/sharedStrings'):
+                    shared_part = _zip_part('xl', el.get('Target'))
+        
+        strings = []
+        string_iter = _iter_shared_strings(z, shared_part)
+        
+        def shared_string(i):
+            # Shared strings are only parsed up to the highest index the header uses
+            while len(strings) <= i:
+                strings.append(next(string_iter))
+            return strings[i]
+        
+        header = []
+        with z.open(sheet_part) as f:
+            for _, el in ET.iterparse(f):
+                if _local(el.tag) != 'row':
+                    continue
+                
+                # Like read_excel(nrows=0), only sheet row 1 is the header
+                if el.get('r', '1') != '1':
+                    break
+                
+                row = []
+                for c in el:
+                    if _local(c.tag) != 'c':
+                        continue
+                    ref = c.get('r')
+                    col = _col_index(ref) if ref else len(row)
+                    row.extend([None] * (col - len(row)))
+                    
+                    kind = c.get('t', 'n')
+                    v = next((ch.text for ch in c if _local(ch.tag) == 'v'), None)
+                    if kind == 'inlineStr':
+                        value = next((_xml_text(ch) for ch in c if _local(ch.tag) == 'is'), None)
+                    elif v is None:
+                        value = None
+                    elif kind == 's':
+                        value = shared_string(int(v))
+                    elif kind == 'b':
+                        value = bool(int(v))
+                    elif kind == 'n':
+                        # Styled numbers may be dates; only the styles part can tell
+                        if c.get('s', '0') != '0':
+                            return None
+                        value = float(v) if any(ch in v for ch in '.eE') else int(v)
+                    elif kind == 'e':
+                        value = _ERROR_CELL
+                    elif kind == 'str':
+                        value = v
+                    else:
+                        return None
+                    row.append(value)
+                
+                header = row
+                break
+    
+    # pandas drops trailing blank cells and reads integral floats as ints
+    while header and (header[-1] is None or header[-1] == ''):
+        header.pop()
+    header = [int(v) if isinstance(v, float) and v.is_integer() else v for v in header]
+    
+    return _normalize_header(header)
+
+
+def _iter_shared_strings(z, part):
+    """Stream the shared string table of an open workbook archive."""
+    
+    if part is None:
+        return
+    with z.open(part) as f:
+        for _, el in ET.iterparse(f):
+            if _local(el.tag) == 'si':
+                yield _xml_text(el).replace('x005F_', '')
+                el.clear()
+
+
+def _read_excel_header_openpyxl(full_path):
+    """
+    Read row 1 of the first sheet in read-only mode (no cell styles or
+    full workbook materialized), converting cells as read_excel does.
+    """
+    
+    wb = openpyxl.load_workbook(full_path, read_only=True, data_only=True)
+    try:
+        if not wb.sheetnames:
+            return []
+        
+        row = next(wb[wb.sheetnames[0]].iter_rows(max_row=1), ())
+        header = [_ERROR_CELL if cell.data_type == 'e' else cell.value for cell in row]
+    finally:
+        wb.close()
+    
+    # pandas drops trailing blank cells and reads integral floats as ints
+    while header and (header[-1] is None or header[-1] == ''):
+        header.pop()
+    header = [int(v) if isinstance(v, float) and v.is_integer() else v for v in header]
+    
+    return _normalize_header(header)
+
+
+def _read_header(task):
+    """
+    Read the column names of one discovered file.
+    
+    Args:
+        task (tuple): (full_path, rel_path, is_csv)
+    
+    Returns:
+        tuple: (rel_path, columns, error) — error is the exception type
+            name if the file could not be read, else None
+    """
+    
+    full_path, rel_path, is_csv = task
+    
+    try:
+        if is_csv:
+            # Only the header line is needed; skip the full parser. Like
+            # read_csv, leading empty or whitespace-only lines are skipped
+            # and a file with no header line raises EmptyDataError.
+            with open(full_path, 'r', encoding='utf-8-sig', newline='') as f:
+                lines = itertools.dropwhile(lambda line: not line.strip(' \t\r\n'), f)
+                header = next(csv.reader(lines), None)
+            if header is None:
+                raise EmptyDataError("No columns to parse from file")
+            columns = _normalize_header(header)
+            
+        else:
+            columns = None
+            if str(full_path).lower().endswith(('.xlsx', '.xlsm')):
+                try:
+                    columns = _read_xlsx_header_zip(full_path)
+                except Exception:
+                    columns = None
+            
+            if columns is None and OPENPYXL_AVAILABLE:
+                try:
+                    columns = _read_excel_header_openpyxl(full_path)
+                except Exception:
+                    columns = None
+            
+            # Fall back to pandas (.xls, or anything the readers above cannot open)
+            if columns is None:
+                xls = pd.ExcelFile(full_path)
+                first_sheet = xls.sheet_names[0] if xls.sheet_names else None
+                
+                if first_sheet:
+                    df = pd.read_excel(full_path, sheet_name=first_sheet, nrows=0)
+                    columns = df.columns.tolist()
+                else:
+                    columns = []
+    
+    except Exception as e:
+        return rel_path, None, type(e).__name__
+    
+    return rel_path, columns, None
+
+
+def _iter_files(root):
+    """
+    Yield the os.DirEntry of every schema file under root, in the same
+    top-down order as os.walk, using the file type scandir already cached.
+    """
+    
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        
+        subdirs = []
+        for e in entries:
+            if e.is_dir():
+                # Like os.walk, do not descend into symlinked directories
+                if not e.is_symlink():
+                    subdirs.append(e.path)
+            elif e.name.lower().endswith(_SCHEMA_SUFFIXES):
+                yield e
+        stack.extend(reversed(subdirs))
+
+
+def _load_schema_cache(cache_path, root):
+    """
+    Load cached headers written by a previous scan of the same root.
+    
+    Args:
+        cache_path (str): Cache file path
+        root (str): Resolved data directory the cache must belong to
+    
+    Returns:
+        dict: {rel_path: [mtime_ns, size, columns], ...} (empty on a miss,
+            a format version change or an unreadable cache)
+    """
+    
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    
+    if not isinstance(cache, dict):
+        return {}
+    if cache.get('_v') != _SCHEMA_CACHE_VERSION or cache.get('root') != root:
+        return {}
+    return cache.get('files', {})
+
+
+def _save_schema_cache(cache_path, root, files):
+    """
+    Atomically replace the header cache (written to a temp file first, so
+    an interrupted scan never leaves a truncated cache behind).
+    
+    Headers with a column name JSON cannot round-trip (e.g. a datetime
+    from the Excel fallbacks) are left out and re-read on the next scan.
+    
+    Args:
+        cache_path (str): Cache file path
+        root (str): Resolved data directory the entries belong to
+        files (dict): {rel_path: [mtime_ns, size, columns], ...}
+    """
+    
+    files = {
+        rel_path: entry for rel_path, entry in files.items()
+        if all(isinstance(col, (str, int, float)) for col in entry[2])
+    }
+    
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'_v': _SCHEMA_CACHE_VERSION, 'root': root, 'files': files}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠ Schema cache not saved ({type(e).__name__})")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def scan_schema(data_dir="data", cache_path="outputs/schema_cache.json"):
     """
     Recursively discover all CSV/XLS/XLSX/XLSM files and extract column names.
     
+    Header reads are I/O-bound and independent, so they run on a thread pool;
+    results are reported in discovery order. Files whose modification time
+    and size match the cache reuse their cached header instead of being read.
+    
     Args:
         data_dir (str): Root directory containing study folders
+        cache_path (str): Header cache file, or None to always read headers
     
     Returns:
         dict: {file_path: [list of column names], ...}
@@ -30,47 +422,55 @@ def scan_schema(data_dir="data"):
         print(f"❌ ERROR: Directory '{data_dir}' not found.")
         return schema_map
     
-    # Find all files recursively
-    excel_extensions = {'.xls', '.xlsx', '.xlsm'}
-    csv_extensions = {'.csv'}
+    root = str(data_path.resolve())
+    cache = _load_schema_cache(cache_path, root) if cache_path else {}
     
-    for root, dirs, files in os.walk(data_path):
-        for file in files:
-            file_lower = file.lower()
-            
-            is_excel = any(file_lower.endswith(ext) for ext in excel_extensions)
-            is_csv = any(file_lower.endswith(ext) for ext in csv_extensions)
-            
-            if not (is_excel or is_csv):
-                continue
-            
-            full_path = Path(root) / file
-            rel_path = full_path.relative_to(data_path)
-            
-            try:
-                if is_csv:
-                    df = pd.read_csv(full_path, nrows=0, encoding='utf-8')
-                    columns = df.columns.tolist()
-                    
-                elif is_excel:
-                    xls = pd.ExcelFile(full_path)
-                    first_sheet = xls.sheet_names[0] if xls.sheet_names else None
-                    
-                    if first_sheet:
-                        df = pd.read_excel(full_path, sheet_name=first_sheet, nrows=0)
-                        columns = df.columns.tolist()
-                    else:
-                        columns = []
-                
-                if columns:
-                    schema_map[str(rel_path)] = columns
-                    print(f"✓ {rel_path}: {len(columns)} columns found")
-                else:
-                    print(f"⚠ {rel_path}: No columns detected (empty or unreadable)")
-            
-            except Exception as e:
-                print(f"⚠ {rel_path}: Could not read ({type(e).__name__})")
-                continue
+    # (rel_path, [mtime_ns, size], cached columns or None) in discovery order
+    found = []
+    tasks = []
+    for entry in _iter_files(data_path):
+        full_path = Path(entry.path)
+        rel_path = full_path.relative_to(data_path)
+        try:
+            st = entry.stat()
+            key = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            key = None
+        
+        hit = cache.get(str(rel_path))
+        if key is not None and hit is not None and hit[:2] == key:
+            found.append((rel_path, key, hit[2]))
+        else:
+            found.append((rel_path, key, None))
+            tasks.append((full_path, rel_path, entry.name.lower().endswith('.csv')))
+    
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        read = iter(list(ex.map(_read_header, tasks)))
+    
+    results = []
+    new_cache = {}
+    for rel_path, key, columns in found:
+        error = None
+        if columns is None:
+            _, columns, error = next(read)
+        if error is None and key is not None:
+            new_cache[str(rel_path)] = key + [columns]
+        results.append((rel_path, columns, error))
+    
+    if cache_path:
+        _save_schema_cache(cache_path, root, new_cache)
+        if len(tasks) < len(found):
+            print(f"✓ Reused {len(found) - len(tasks)} cached headers from {cache_path}")
+    
+    for rel_path, columns, error in results:
+        if error:
+            print(f"⚠ {rel_path}: Could not read ({error})")
+        elif columns:
+            schema_map[str(rel_path)] = columns
+            print(f"✓ {rel_path}: {len(columns)} columns found")
+        else:
+            print(f"⚠ {rel_path}: No columns detected (empty or unreadable)")
     
     return schema_map
 
@@ -86,41 +486,69 @@ def save_schema_summary(schema_map, output_path="outputs/schema_summary.txt"):
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write("=" * 80 + "\n")
-        f.write("CLINICAL TRIAL DATA SCHEMA DISCOVERY REPORT\n")
-        f.write("=" * 80 + "\n\n")
-        
-        f.write(f"Total files discovered: {len(schema_map)}\n")
-        f.write(f"Generated: {pd.Timestamp.now()}\n\n")
-        
-        # Group by study folder
-        studies = {}
-        for file_path in sorted(schema_map.keys()):
-            parts = file_path.split(os.sep)
-            study_folder = next((p for p in parts if p.startswith("Study_")), "Unknown")
-            
-            if study_folder not in studies:
-                studies[study_folder] = []
-            studies[study_folder].append(file_path)
+    # Build the whole report in memory and write it once
+    chunks = [
+        "=" * 80 + "\n",
+        "CLINICAL TRIAL DATA SCHEMA DISCOVERY REPORT\n",
+        "=" * 80 + "\n\n",
+        f"Total files discovered: {len(schema_map)}\n",
+        f"Generated: {pd.Timestamp.now()}\n\n",
+    ]
+    
+    # Group by study folder
+    studies = defaultdict(list)
+    for file_path in sorted(schema_map):
+        m = _STUDY_RE.search(file_path)
+        studies[m.group(0).lstrip(_PATH_SEPS) if m else "Unknown"].append(file_path)
+    
+    # Write organized by study
+    for study in sorted(studies.keys()):
+        chunks.append(f"\n{'='*80}\nSTUDY: {study}\n{'='*80}\n")
         
-        # Write organized by study
-        for study in sorted(studies.keys()):
-            f.write(f"\n{'='*80}\n")
-            f.write(f"STUDY: {study}\n")
-            f.write(f"{'='*80}\n")
-            
-            for file_path in sorted(studies[study]):
-                columns = schema_map[file_path]
-                f.write(f"\nFile: {file_path}\n")
-                f.write(f"  Columns ({len(columns)}):\n")
-                
-                for col in columns:
-                    f.write(f"    - {col}\n")
+        # Files were appended in sorted order
+        for file_path in studies[study]:
+            columns = schema_map[file_path]
+            chunks.append(f"\nFile: {file_path}\n  Columns ({len(columns)}):\n")
+            chunks.extend(f"    - {col}\n" for col in columns)
+    
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("".join(chunks))
     
     print(f"\n✓ Schema summary saved to: {output_path}")
 
 
+def _write_json(schema_map, path):
+    """
+    Write the schema map as 2-space indented JSON, with orjson when it is
+    installed. orjson writes NaN/Infinity column names (Excel error cells)
+    as null, so maps containing them go through stdlib json, which keeps
+    them as NaN/Infinity like the original dump.
+    
+    Args:
+        schema_map (dict): {file_path: [columns], ...}
+        path (str): Output file path
+    """
+    
+    non_finite = any(
+        isinstance(col, float) and not math.isfinite(col)
+        for columns in schema_map.values() for col in columns
+    )
+    
+    if ORJSON_AVAILABLE and not non_finite:
+        try:
+            data = orjson.dumps(schema_map, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            # e.g. integers beyond 64 bits; stdlib json handles those
+            data = None
+        if data is not None:
+            with open(path, 'wb') as f:
+                f.write(data)
+            return
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(schema_map, f, indent=2)
+
+
 if __name__ == "__main__":
     print("\n" + "=" * 80)
     print("STEP 1: SCHEMA DISCOVERY")
@@ -136,7 +564,6 @@ if __name__ == "__main__":
         save_schema_summary(schema_map, output_path="outputs/schema_summary.txt")
         
         os.makedirs("outputs", exist_ok=True)
-        with open("outputs/schema_map.json", 'w', encoding='utf-8') as f:
-            json.dump(schema_map, f, indent=2)
+        _write_json(schema_map, "outputs/schema_map.json")
         
         print("✓ Schema map (JSON) saved for downstream processing\n")
\ No newline at end of file